@@ -1,50 +1,59 @@
 import groq
+import httpx
+import orjson
 import os
-import json
+import asyncio
+import random
 import re
-from typing import List
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Dict, Final, List, Optional, Tuple
 
 from .common import CommonTranslator, MissingAPIKeyException
 from .keys import GROQ_API_KEY, GROQ_MODEL
+from .tokenizers.token_counters import ChatGPTTokenCounter
 
-class GroqTranslator(CommonTranslator):
-    _LANGUAGE_CODE_MAP = {
-        'CHS': 'Simplified Chinese', 'CHT': 'Traditional Chinese', 'CSY': 'Czech',
-        'NLD': 'Dutch', 'ENG': 'English', 'FRA': 'French', 'DEU': 'German',
-        'HUN': 'Hungarian', 'ITA': 'Italian', 'JPN': 'Japanese', 'KOR': 'Korean',
-        'PLK': 'Polish', 'PTB': 'Portuguese', 'ROM': 'Romanian', 'RUS': 'Russian',
-        'ESP': 'Spanish', 'TRK': 'Turkish', 'UKR': 'Ukrainian', 'VIN': 'Vietnamese',
-        'CNR': 'Montenegrin', 'SRP': 'Serbian', 'HRV': 'Croatian', 'ARA': 'Arabic',
-        'THA': 'Thai', 'IND': 'Indonesian'
-    }
+try:
+    import h2  # noqa: F401 (enables httpx's HTTP/2 support)
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
 
-    _MAX_REQUESTS_PER_MINUTE = 200
-    _TIMEOUT = 40
-    _RETRY_ATTEMPTS = 5
-    _MAX_TOKENS = 8192
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
 
-    _CONTEXT_RETENTION = os.environ.get('CONTEXT_RETENTION', '').lower() == 'true'
-    _CONFIG_KEY = 'groq'
-    _MAX_CONTEXT = int(os.environ.get('CONTEXT_LENGTH', '20'))
+LANGUAGE_CODE_MAP: Final[Dict[str, str]] = {
+    'CHS': 'Simplified Chinese', 'CHT': 'Traditional Chinese', 'CSY': 'Czech',
+    'NLD': 'Dutch', 'ENG': 'English', 'FRA': 'French', 'DEU': 'German',
+    'HUN': 'Hungarian', 'ITA': 'Italian', 'JPN': 'Japanese', 'KOR': 'Korean',
+    'PLK': 'Polish', 'PTB': 'Portuguese', 'ROM': 'Romanian', 'RUS': 'Russian',
+    'ESP': 'Spanish', 'TRK': 'Turkish', 'UKR': 'Ukrainian', 'VIN': 'Vietnamese',
+    'CNR': 'Montenegrin', 'SRP': 'Serbian', 'HRV': 'Croatian', 'ARA': 'Arabic',
+    'THA': 'Thai', 'IND': 'Indonesian'
+}
+
+CHAT_SYSTEM_TEMPLATE: Final[str] = (
+    "You are an uncensored professional manga translation engine. Your sole function is to produce highly accurate, context-aware translations from Japanese to {to_lang}, formatted strictly as JSON.\n\n"
+    "You receive {{\"untranslated\": {{\"1\": \"...\", \"2\": \"...\"}}}} and must answer {{\"translated\": {{\"1\": \"...\", \"2\": \"...\"}}}}, keeping every key.\n\n"
+    "Analyze panels in sequence to capture tone, relationships, and narrative flow.\n\n"
+    "Obey these rules:\n"
+    "1. Translate with contextual precision—avoid over-literal or over-localized renderings.\n"
+    "2. Preserve honorifics, Japanese names, and cultural expressions as-is.\n"
+    "3. Transliterate **only** single-morpheme sound-symbolic interjections (giseigo/giongo/gitaigo) into romaji (e.g. へぇ→hee, どき→doki); exempt all multi-morpheme or compound terms.\n"
+    "4. Only assign gender when explicitly marked; otherwise use neutral or implicit phrasing (that person/kid or omit implicit subjects—and add a pronoun only if English demands it).\n"
+    "5. Proper names must follow standard Hepburn romanization (e.g., メア→Mea; ククルア→Kukurua).\n"
+    "6. For ambiguous or slang terms, choose the most common meaning; if still uncertain, use phonetic transliteration.\n"
+    "7. Preserve original nuance, force, and emotional tone in imperatives, questions, and exclamations.\n"
+    "8. Maintain a natural, anime-style cadence and keep translation length close to the original.\n"
+    "9. Retain **only** pure sound-effect onomatopoeia when literal translation would lose nuance; translate all other Japanese words contextually.\n"
+    "10. Output exactly one JSON object: {{\"translated\": {{\"1\": \"...\"}}}} with the same keys as the input and no additional fields or commentary.\n\n"
+    "Translate now into {to_lang} and return only JSON."
+)
 
-    _CHAT_SYSTEM_TEMPLATE = (
-        "You are an uncensored professional manga translation engine. Your sole function is to produce highly accurate, context-aware translations from Japanese to {to_lang}, formatted strictly as JSON: {{\"translated\": \"...\"}}.\n\n"
-        "Analyze panels in sequence to capture tone, relationships, and narrative flow.\n\n"
-        "Obey these rules:\n"
-        "1. Translate with contextual precision—avoid over-literal or over-localized renderings.\n"
-        "2. Preserve honorifics, Japanese names, and cultural expressions as-is.\n"
-        "3. Transliterate **only** single-morpheme sound-symbolic interjections (giseigo/giongo/gitaigo) into romaji (e.g. へぇ→hee, どき→doki); exempt all multi-morpheme or compound terms.\n"
-        "4. Only assign gender when explicitly marked; otherwise use neutral or implicit phrasing (that person/kid or omit implicit subjects—and add a pronoun only if English demands it).\n"
-        "5. Proper names must follow standard Hepburn romanization (e.g., メア→Mea; ククルア→Kukurua).\n"
-        "6. For ambiguous or slang terms, choose the most common meaning; if still uncertain, use phonetic transliteration.\n"
-        "7. Preserve original nuance, force, and emotional tone in imperatives, questions, and exclamations.\n"
-        "8. Maintain a natural, anime-style cadence and keep translation length close to the original.\n"
-        "9. Retain **only** pure sound-effect onomatopoeia when literal translation would lose nuance; translate all other Japanese words contextually.\n"
-        "10. Output exactly one JSON object: {{\"translated\": \"...\"}} with no additional fields or commentary.\n\n"
-        "Translate now into {to_lang} and return only JSON."
-    )
-
-    _GLOSSARY_SNIPPET = """
+GLOSSARY_SNIPPET: Final[str] = """
     GLOSSARY (fixed mappings):
       あの子   → THAT KID
       あの人   → THAT PERSON
@@ -56,29 +65,242 @@ class GroqTranslator(CommonTranslator):
 
     """
 
-    _CHAT_SAMPLE = [
+CHAT_SAMPLE: Final[List[str]] = [
     (
-        'Translate into English. Return result in JSON.\n'
-        '{{"untranslated": "<|1|>恥ずかしい…\\n<|2|>きみ…\\n<|3|>行った。\\n<|4|>寝てるわね\\n<|5|>あの子は来た"}}'
+        'Translate the following text into English. Return the result in JSON format.\n\n'
+        '{"untranslated": {"1": "恥ずかしい…", "2": "きみ…", "3": "行った。", "4": "寝てるわね", "5": "あの子は来た"}}\n'
     ),
     (
-        '{{"translated": "So embarrassing…\\nHey…\\nWent.\\nSleeping, aren’t they?\\nThat kid came"}}'
+        '{"translated": {"1": "So embarrassing…", "2": "Hey…", "3": "Went.", "4": "Sleeping, aren’t they?", "5": "That kid came"}}'
     ),
-    ]
+]
+
+_THINK_RE = re.compile(r'<think>.*?</think>', re.DOTALL)
+# Greedy: the translations are nested one level inside the outer object
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+_TRANS_KEY_RE = re.compile(r'^\s*"?translated"?\s*:\s*')
+# Models that spend output tokens on a <think> block before answering
+_REASONING_MODEL_RE = re.compile(r'deepseek-r1|qwq|qwen3|gpt-oss', re.IGNORECASE)
+
+
+@lru_cache(maxsize=32)
+def _render_system_prompt(template: str, glossary: str, to_lang: str) -> str:
+    return template.format(to_lang=to_lang) + glossary
 
-    def __init__(self, check_groq_key=True):
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After header), if any."""
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket allowing `rate` units per `per` seconds, with bursts of up to `rate`.
+    A rate <= 0 disables limiting.
+    """
+
+    def __init__(self, rate: float, per: float = 60):
+        self.rate = rate
+        self.per = per
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Waits until `amount` units are available and takes them."""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) * self.per / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def consume(self, amount: float):
+        """Takes `amount` units without waiting. The balance may go negative, delaying later acquires."""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._tokens -= amount
+
+
+class _JsonObjectScanner:
+    """
+    Incrementally tracks the brace depth of streamed model output to tell when the
+    first top-level JSON object is complete. Braces inside JSON strings and inside a
+    leading <think>...</think> block are ignored.
+    """
+
+    def __init__(self):
+        self._head = ''  # Leading text held back until we know whether it opens a <think> block
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str) -> bool:
+        """Consumes the next chunk and returns True once the object has been closed."""
+        if self._head is not None:
+            searched = len(self._head)
+            self._head += text
+            head = self._head.lstrip()
+            if head.startswith('<think>'):
+                end = self._head.find('</think>', max(0, searched - len('</think>')))
+                if end < 0:
+                    return False
+                text = self._head[end + len('</think>'):]
+            elif '<think>'.startswith(head):
+                return False
+            else:
+                text = self._head
+            self._head = None
+
+        for ch in text:
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == '\\':
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._depth > 0
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}' and self._depth:
+                self._depth -= 1
+                if not self._depth:
+                    return True
+        return False
+
+
+# Shared by all translator instances using the same API key and endpoint, since Groq enforces the limits per key
+_BUCKETS: Dict[tuple, TokenBucket] = {}
+
+
+def _shared_bucket(api_key: str, name: str, rate: float) -> TokenBucket:
+    key = (api_key, os.environ.get('GROQ_BASE_URL'), name)
+    if key not in _BUCKETS:
+        _BUCKETS[key] = TokenBucket(rate, 60)
+    return _BUCKETS[key]
+
+
+# One client (and connection pool) per API key and endpoint, reused by every instance
+_CLIENTS: Dict[tuple, groq.AsyncGroq] = {}
+
+
+def _shared_client(api_key: str, timeout: float) -> groq.AsyncGroq:
+    key = (api_key, os.environ.get('GROQ_BASE_URL'))
+    if key not in _CLIENTS:
+        # Retries are handled by GroqTranslator._create_completion, with backoff
+        # HTTP/2 multiplexes concurrent requests over a single connection
+        http_client = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=timeout,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        )
+        _CLIENTS[key] = groq.AsyncGroq(api_key=api_key, max_retries=0, timeout=timeout, http_client=http_client)
+    return _CLIENTS[key]
+
+
+class GroqTranslator(CommonTranslator):
+    _LANGUAGE_CODE_MAP = LANGUAGE_CODE_MAP
+    _CHAT_SYSTEM_TEMPLATE = CHAT_SYSTEM_TEMPLATE
+    _GLOSSARY_SNIPPET = GLOSSARY_SNIPPET
+    _CHAT_SAMPLE = CHAT_SAMPLE
+
+    _MAX_REQUESTS_PER_MINUTE = 200
+    _MAX_TOKENS_PER_MINUTE = int(os.environ.get('GROQ_TOKENS_PER_MINUTE', '-1'))
+    _TIMEOUT = 40
+    _RETRY_ATTEMPTS = 5
+    _MAX_TOKENS = 8192
+    # Context window of the Groq-hosted chat models; bounds the retained context
+    _MODEL_CONTEXT = int(os.environ.get('GROQ_MODEL_CONTEXT', '131072'))
+    # Seconds worth of the per-minute request budget that may be in flight at once
+    _CONCURRENCY_WINDOW = 5
+
+    _CONTEXT_RETENTION = os.environ.get('CONTEXT_RETENTION', '').lower() == 'true'
+    _CONFIG_KEY = 'groq'
+    _MAX_CONTEXT = int(os.environ.get('CONTEXT_LENGTH', '20'))
+    # Translations remembered per (to_lang, query); only used without context retention
+    _CACHE_SIZE = 4096
+    # Shorter context messages are stored as-is; zstd's frame overhead would outweigh the saving
+    _COMPRESS_MIN_BYTES = 256
+
+    def __init__(self, check_groq_key=True, compressed_context=True):
         super().__init__()
-        self.client = groq.AsyncGroq(api_key=GROQ_API_KEY)
+        self.client = _shared_client(GROQ_API_KEY, self._TIMEOUT)
         if not self.client.api_key and check_groq_key:
             raise MissingAPIKeyException('Please set the GROQ_API_KEY environment variable.')
         self.token_count = 0
         self.token_count_last = 0
+        self._cache: OrderedDict = OrderedDict()
+        self._system_tokens: Dict[str, int] = {}
         self.config = None
         self.model = GROQ_MODEL
-        self.messages = [
+        self._reasoning = bool(_REASONING_MODEL_RE.search(self.model))
+        # Groq validates JSON mode output server-side; reasoning models keep streaming so that
+        # their <think> block can be skipped and the read stopped once the answer is complete
+        self._complete = self._stream_completion if self._reasoning else self._json_completion
+        self._request_bucket = _shared_bucket(GROQ_API_KEY, 'requests', self._MAX_REQUESTS_PER_MINUTE)
+        self._token_bucket = _shared_bucket(GROQ_API_KEY, 'tokens', self._MAX_TOKENS_PER_MINUTE)
+        self._semaphore = asyncio.Semaphore(
+            max(1, self._MAX_REQUESTS_PER_MINUTE // 60 * self._CONCURRENCY_WINDOW)
+        )
+        self._prefix_cache: Dict[str, str] = {}
+        # Retained context outlives single pages, so all but the latest exchange are kept zstd-compressed
+        self.compressed_context = compressed_context and self._CONTEXT_RETENTION and zstd is not None
+        if self.compressed_context:
+            self._compressor = zstd.ZstdCompressor(level=1)
+            self._decompressor = zstd.ZstdDecompressor()
+        # Context retention is fixed for the process, so the dependent code paths are picked once
+        if self._CONTEXT_RETENTION:
+            self._finalize_context = self._finalize_keep_compressed if self.compressed_context else self._finalize_keep
+            # The answer depends on earlier pages, so translations are never reused
+            self._cache_get = self._cache_get_disabled
+            self._cache_put = self._cache_put_disabled
+        else:
+            self._finalize_context = self._finalize_drop
+        # Loaded on first use: tiktoken may need to download its encoding
+        self.tokenizer = None
+        self._tokenizer_loaded = False
+        # Oldest entries fall off automatically once the context is full. Entries remember
+        # their token count, so compressed ones never need expanding just to be measured.
+        self.messages = deque([
             {'role': 'user', 'content': self.chat_sample[0]},
             {'role': 'assistant', 'content': self.chat_sample[1]}
-        ]
+        ], maxlen=self._MAX_CONTEXT)
+
+    @property
+    def config(self):
+        return self._config
+
+    @config.setter
+    def config(self, config):
+        self._config = config
+        self._resolved = False
+        # Cached translations were produced with the previous prompt and sampling settings
+        self._cache.clear()
+        self._system_tokens.clear()
+
+    def _resolve_config(self):
+        """Snapshots the config values used on every request into plain attributes."""
+        self._tpl = self.chat_system_template
+        self._temp = self.temperature
+        self._top_p = self.top_p
+        self._resolved = True
 
     def _config_get(self, key: str, default=None):
         if not self.config:
@@ -101,69 +323,329 @@ class GroqTranslator(CommonTranslator):
     def top_p(self) -> float:
         return self._config_get('top_p', default=0.92)
 
+    def _system_for(self, to_lang: str) -> str:
+        # Rendered once per template/language; an identical prefix also lets Groq reuse its prompt cache
+        return _render_system_prompt(self._tpl, self._GLOSSARY_SNIPPET, to_lang)
+
+    async def _ratelimit_sleep(self):
+        # Requests are paced by the shared request bucket in _create_completion instead
+        pass
+
     async def _translate(self, from_lang: str, to_lang: str, queries: List[str]) -> List[str]:
-        results = []
-        for prompt in queries:
-            response = await self._request_translation(to_lang, prompt)
-            results.append(response.get("translated", ""))
-        self.logger.info(f'Used {self.token_count_last} tokens (Total: {self.token_count})')
+        results = [''] * len(queries)
+        # Repeated bubbles (sound effects, names) are only sent once
+        pending: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            cached = self._cache_get(to_lang, query)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(query, []).append(i)
+
+        if pending:
+            unique_queries = list(pending)
+            translations, trusted = await self._translate_uncached(to_lang, unique_queries)
+            for query, translation, ok in zip(unique_queries, translations, trusted):
+                if translation and ok:
+                    self._cache_put(to_lang, query, translation)
+                for i in pending[query]:
+                    results[i] = translation
+            self.logger.info(f'Used {self.token_count_last} tokens (Total: {self.token_count})')
         return results
 
-    async def _request_translation(self, to_lang: str, prompt: str) -> dict:
-        # 1) Build the user prompt
-        prompt_with_lang = (
-            f"Translate the following text into {to_lang}. Return the result in JSON format.\n\n"
-            f"{{\"untranslated\": \"{prompt}\"}}\n"
+    async def _translate_uncached(self, to_lang: str, queries: List[str]) -> Tuple[List[str], List[bool]]:
+        """
+        Returns the translations and, for each of them, whether it came from a well-formed
+        reply and may be cached.
+        """
+        # Send all queries in a single request, keyed by their 1-based position
+        untranslated = {str(i): query for i, query in enumerate(queries, 1)}
+        results, trusted = self._accept_reply(await self._request_translation(to_lang, untranslated), len(queries))
+        if results is not None:
+            return results, [trusted] * len(queries)
+
+        self.logger.warning('Batch response does not match the requested keys, translating queries one by one')
+        responses = await asyncio.gather(
+            *(self._request_single(to_lang, query) for query in queries),
+            return_exceptions=True
         )
-        self.messages.append({'role': 'user', 'content': prompt_with_lang})
-        if len(self.messages) > self._MAX_CONTEXT:
-            self.messages = self.messages[-self._MAX_CONTEXT:]
+        results, trusted = [], []
+        for query, response in zip(queries, responses):
+            if isinstance(response, Exception):
+                self.logger.error(f'Failed to translate "{query}": {response}')
+                results.append('')
+                trusted.append(False)
+                continue
+            translated, ok = self._accept_reply(response, 1)
+            results.append(translated[0] if translated else '')
+            trusted.append(ok)
+        return results, trusted
+
+    def _accept_reply(self, reply: Tuple[dict, Optional[tuple]], count: int) -> Tuple[Optional[List[str]], bool]:
+        """
+        Parses a reply from _request_translation and records it as context if it was
+        real JSON with the requested keys. Returns the translations (None if the reply
+        is unusable) and whether the reply was well-formed.
+        """
+        data, exchange = reply
+        translations = self._parse_translations(data, count)
+        # Text rescued from a malformed reply is still returned, but never reused
+        trusted = translations is not None and exchange is not None and isinstance(data['translated'], dict)
+        if trusted:
+            self._finalize_context(*exchange)
+        return translations, trusted
+
+    def _cache_get(self, to_lang: str, query: str) -> Optional[str]:
+        key = (to_lang, query)
+        translation = self._cache.get(key)
+        if translation is not None:
+            self._cache.move_to_end(key)
+        return translation
+
+    def _cache_put(self, to_lang: str, query: str, translation: str):
+        self._cache[(to_lang, query)] = translation
+        self._cache.move_to_end((to_lang, query))
+        if len(self._cache) > self._CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _cache_get_disabled(to_lang: str, query: str) -> Optional[str]:
+        return None
+
+    @staticmethod
+    def _cache_put_disabled(to_lang: str, query: str, translation: str):
+        pass
+
+    def _finalize_keep(self, user_msg: dict, json_str: str):
+        # Record the exchange in one step once the reply is in
+        self.messages.extend(({'role': 'user', 'content': user_msg['content']},
+                              {'role': 'assistant', 'content': json_str}))
+
+    def _finalize_keep_compressed(self, user_msg: dict, json_str: str):
+        self._finalize_keep(user_msg, json_str)
+        # The previous exchange is no longer among the two most recent messages
+        for i in (-4, -3):
+            if len(self.messages) >= -i and 'content' in self.messages[i]:
+                msg = self.messages[i]
+                raw = msg['content'].encode()
+                if len(raw) >= self._COMPRESS_MIN_BYTES:
+                    self.messages[i] = {'role': msg['role'], '_z': self._compressor.compress(raw),
+                                        'tokens': self._message_tokens(msg)}
+
+    def _message_tokens(self, msg: dict) -> int:
+        """Token count of a context entry, counted once and stored on it."""
+        tokens = msg.get('tokens')
+        if tokens is None:
+            tokens = msg['tokens'] = self._count_tokens(msg['content'])
+        return tokens
+
+    def _expand(self, msg: dict) -> dict:
+        """The API form of a context entry, without the bookkeeping keys."""
+        if '_z' in msg:
+            return {'role': msg['role'], 'content': self._decompressor.decompress(msg['_z']).decode()}
+        return {'role': msg['role'], 'content': msg['content']}
+
+    def _finalize_drop(self, user_msg: dict, json_str: str):
+        pass
+
+    async def _request_single(self, to_lang: str, query: str) -> Tuple[dict, Optional[Tuple[dict, str]]]:
+        async with self._semaphore:
+            return await self._request_translation(to_lang, {'1': query})
+
+    def _count_tokens(self, text: str) -> int:
+        """
+        Counts tokens with tiktoken (no public tokenizer exists for Groq-hosted models;
+        cl100k_base is a close approximation). Falls back to roughly one token per two
+        characters if the encoding cannot be loaded, e.g. when offline.
+        """
+        if not self._tokenizer_loaded:
+            self._tokenizer_loaded = True
+            try:
+                self.tokenizer = ChatGPTTokenCounter(self.model)
+            except Exception as e:
+                self.logger.warning(f'Could not load a tokenizer, estimating token counts from text length: {e}')
+        if self.tokenizer is None:
+            return len(text) // 2
+        return self.tokenizer.count_tokens(text)
+
+    def _estimate_max_tokens(self, body: str) -> int:
+        """
+        Output budget scaled to the payload: roughly one token per two source
+        characters, tripled to leave room for the translation and JSON keys.
+        Reasoning models get half of _MAX_TOKENS for their <think> block on top.
+        """
+        estimate = max(64, 3 * (len(body) // 2) + 32)
+        if self._reasoning:
+            return min(self._MAX_TOKENS, self._MAX_TOKENS // 2 + estimate)
+        return min(self._MAX_TOKENS // 2, estimate)
+
+    def _context_within_budget(self, reserved: int) -> Tuple[List[dict], int]:
+        """
+        Returns the newest context messages that fit into _MODEL_CONTEXT next to the
+        `reserved` tokens (system prompt, user prompt and output budget), and their token count.
+        The oldest messages are dropped first, without splitting a user/assistant pair.
+        Compressed messages are only expanded if they are sent.
+        """
+        budget = self._MODEL_CONTEXT - reserved
+        kept = []
+        used = 0
+        for msg in reversed(self.messages):
+            tokens = self._message_tokens(msg)
+            if tokens > budget:
+                break
+            budget -= tokens
+            used += tokens
+            kept.append(msg)
+        if kept and kept[-1]['role'] == 'assistant':
+            used -= self._message_tokens(kept.pop())
+        kept.reverse()
+        return [self._expand(msg) for msg in kept], used
+
+    async def _create_completion(self, **kwargs) -> Tuple[str, Optional[int]]:
+        """
+        Calls the chat completion API, retrying rate limits and transient errors
+        with exponential backoff and jitter.
+        Returns the raw output and the total token usage, if Groq reported it.
+        """
+        for attempt in range(1, self._RETRY_ATTEMPTS + 1):
+            # Wait for a free request slot and until earlier replies are paid off in tokens
+            await self._request_bucket.acquire()
+            await self._token_bucket.acquire(0)
+            try:
+                return await asyncio.wait_for(self._complete(**kwargs), timeout=self._TIMEOUT)
+            except (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError, asyncio.TimeoutError) as e:
+                if attempt == self._RETRY_ATTEMPTS:
+                    raise
+                delay = _retry_after(e) or min(2 ** attempt, 30) + random.random()
+                self.logger.warning(
+                    f'Groq request failed ({e.__class__.__name__}), retrying in {delay:.1f}s '
+                    f'(attempt {attempt}/{self._RETRY_ATTEMPTS})'
+                )
+                await asyncio.sleep(delay)
+
+    async def _json_completion(self, **kwargs) -> Tuple[str, Optional[int]]:
+        """Requests a single JSON object through Groq's JSON mode."""
+        try:
+            response = await self.client.chat.completions.create(
+                response_format={'type': 'json_object'}, **kwargs
+            )
+        except groq.BadRequestError as e:
+            # Output that fails JSON validation is rejected, but Groq returns what was generated
+            body = e.body if isinstance(e.body, dict) else {}
+            # The SDK keeps the whole response body, with the details under "error"
+            body = body.get('error', body)
+            if not isinstance(body, dict) or body.get('code') != 'json_validate_failed':
+                raise
+            self.logger.warning('Groq rejected the output as invalid JSON, parsing the failed generation')
+            return body.get('failed_generation') or '', None
+        usage = response.usage.total_tokens if response.usage else None
+        return response.choices[0].message.content, usage
+
+    async def _stream_completion(self, **kwargs) -> Tuple[str, Optional[int]]:
+        """
+        Streams the completion and stops reading as soon as the JSON object is closed,
+        which also cuts off any trailing commentary. Usage is only reported in the final
+        chunk, so it is None when the stream was left early.
+        """
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        scanner = _JsonObjectScanner()
+        parts = []
+        usage = None
+        try:
+            async for chunk in stream:
+                x_groq = getattr(chunk, 'x_groq', None)
+                if x_groq is not None and getattr(x_groq, 'usage', None) is not None:
+                    usage = x_groq.usage.total_tokens
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                content = chunk.choices[0].delta.content
+                parts.append(content)
+                if scanner.feed(content):
+                    break
+        finally:
+            await stream.close()
+        return ''.join(parts), usage
+
+    @staticmethod
+    def _parse_translations(data: dict, count: int) -> Optional[List[str]]:
+        """
+        Maps the indexed "translated" object back to a list in query order.
+        Returns None if the response does not contain every requested key.
+        """
+        translated = data.get('translated') if isinstance(data, dict) else None
+        if count == 1 and isinstance(translated, str):
+            return [translated]
+        if not isinstance(translated, dict):
+            return None
+        try:
+            return [str(translated[str(i)]) for i in range(1, count + 1)]
+        except KeyError:
+            return None
+
+    async def _request_translation(self, to_lang: str, untranslated: Dict[str, str]) -> Tuple[dict, Optional[Tuple[dict, str]]]:
+        """
+        Returns the parsed reply and the (user message, reply JSON) exchange, which the
+        caller records as context once the reply has been validated. The exchange is None
+        if the reply was not valid JSON and only the fallback could salvage it.
+        """
+        if not self._resolved:
+            self._resolve_config()
+
+        # 1) Build the user prompt
+        body = orjson.dumps({'untranslated': untranslated}).decode()
+        prefix = self._prefix_cache.get(to_lang)
+        if prefix is None:
+            prefix = self._prefix_cache[to_lang] = (
+                f"Translate the following text into {to_lang}. Return the result in JSON format.\n\n"
+            )
+        prompt_with_lang = prefix + body + "\n"
+        user_msg = {'role': 'user', 'content': prompt_with_lang}
 
         # 2) System message (with your full template)
-        system_msg = {
-            'role': 'system',
-            'content': self.chat_system_template.format(to_lang=to_lang)
-                       + self._GLOSSARY_SNIPPET
-        }
+        system_msg = {'role': 'system', 'content': self._system_for(to_lang)}
+
+        # Snapshot the context so concurrent requests never see each other's prompts
+        max_tokens = self._estimate_max_tokens(body)
+        system_tokens = self._system_tokens.get(to_lang)
+        if system_tokens is None:
+            system_tokens = self._system_tokens[to_lang] = self._count_tokens(system_msg['content'])
+        prompt_tokens = system_tokens + self._count_tokens(prompt_with_lang)
+        context, context_tokens = self._context_within_budget(prompt_tokens + max_tokens)
+        messages = [system_msg, *context, user_msg]
 
         # 3) Call the API
-        response = await self.client.chat.completions.create(
+        raw, usage = await self._create_completion(
             model=self.model,
-            messages=[system_msg] + self.messages,
-            max_tokens=self._MAX_TOKENS // 2,
-            temperature=self.temperature,
-            top_p=self.top_p
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=self._temp,
+            top_p=self._top_p
         )
 
-        # 4) Update token usage
-        self.token_count += response.usage.total_tokens
-        self.token_count_last = response.usage.total_tokens
-
-        # 5) Grab raw output
-        raw = response.choices[0].message.content
+        # 4) Update token usage, estimating it when Groq did not report it
+        if usage is None:
+            usage = prompt_tokens + context_tokens + self._count_tokens(raw)
+        self.token_count += usage
+        self.token_count_last = usage
+        self._token_bucket.consume(usage)
 
-        # 6) Strip out any <think>…</think> blocks
-        cleaned = re.sub(r'<think>.*?</think>', '', raw, flags=re.DOTALL)
-
-        # 7) Extract the first JSON object
-        match = re.search(r'\{.*?\}', cleaned, flags=re.DOTALL)
-        json_str = match.group(0) if match else cleaned
-
-        # 8) Parse JSON safely
+        # 5) Fast path: a well-behaved model answers with bare JSON
         try:
-            data = json.loads(json_str)
-        except json.JSONDecodeError:
-            # Fallback: remove any leading 'translated":'
-            fallback = re.sub(r'^\s*"?translated"?\s*:\s*', '', json_str)
-            fallback = fallback.strip(' \'"{}')
-            data = {"translated": fallback}
-
-        # 9) Context retention
-        if self._CONTEXT_RETENTION:
-            self.messages.append({'role': 'assistant', 'content': json_str})
-        else:
-            # remove any placeholder assistant message
-            if self.messages and self.messages[-1]['role'] == 'assistant':
-                self.messages.pop()
+            json_str = raw.strip()
+            data = orjson.loads(json_str)
+        except orjson.JSONDecodeError:
+            # 6) Strip out any <think>…</think> blocks and extract the outermost JSON object
+            cleaned = _THINK_RE.sub('', raw)
+            match = _JSON_RE.search(cleaned)
+            json_str = match.group(0) if match else cleaned
+
+            # 7) Parse JSON safely
+            try:
+                data = orjson.loads(json_str)
+            except orjson.JSONDecodeError:
+                # Fallback: remove any leading 'translated":'
+                fallback = _TRANS_KEY_RE.sub('', json_str)
+                fallback = fallback.strip(' \'"{}')
+                return {"translated": fallback}, None
 
-        return data
+        return data, (user_msg, json_str)
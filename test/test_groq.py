@@ -0,0 +1,134 @@
+import asyncio
+import pytest
+
+from manga_translator.translators.groq import GroqTranslator, TokenBucket, _JsonObjectScanner
+
+
+def feed_all(chunks):
+    scanner = _JsonObjectScanner()
+    return [scanner.feed(chunk) for chunk in chunks]
+
+def test_scanner_complete_object():
+    assert feed_all(['{"translated": {"1": "a"}}']) == [True]
+
+def test_scanner_object_split_across_chunks():
+    assert feed_all(['{"translated": {"1"', ': "a"}', '}']) == [False, False, True]
+
+def test_scanner_ignores_braces_in_strings():
+    assert feed_all(['{"1": "}{"', ', "2": "\\"}"', '}']) == [False, False, True]
+
+def test_scanner_ignores_braces_in_think():
+    assert feed_all(['<think>{ maybe } {', '</think>', '{"1": "a"}']) == [False, False, True]
+
+@pytest.mark.parametrize('chunks', [
+    ['<thi', 'nk>{}', '</think>{}'],
+    ['  <', 'think>', '{}</thi', 'nk>', '{}'],
+])
+def test_scanner_think_tag_split_across_chunks(chunks):
+    results = feed_all(chunks)
+    assert results[-1] and not any(results[:-1])
+
+def test_scanner_unclosed_object():
+    assert feed_all(['{"translated": {"1": "a"}', ', "2": "b"']) == [False, False]
+
+def test_scanner_unclosed_think():
+    assert feed_all(['<think>{"1": "a"}']) == [False]
+
+async def elapsed(*amounts, bucket: TokenBucket):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for amount in amounts:
+        await bucket.acquire(amount)
+    return loop.time() - start
+
+@pytest.mark.asyncio
+async def test_bucket_allows_burst():
+    # 10 units per 0.5s: a burst of 10 must not wait
+    bucket = TokenBucket(10, 0.5)
+    assert await elapsed(*[1] * 10, bucket=bucket) < 0.05
+
+@pytest.mark.asyncio
+async def test_bucket_refills_over_time():
+    bucket = TokenBucket(10, 0.5)
+    await elapsed(10, bucket=bucket)
+    # Five units take a quarter of the period to come back
+    assert 0.2 <= await elapsed(5, bucket=bucket) < 0.4
+
+@pytest.mark.asyncio
+async def test_bucket_consume_debt_delays_acquire():
+    bucket = TokenBucket(10, 0.5)
+    bucket.consume(15)
+    # The balance is -5, so even a zero-sized acquire waits for it to recover
+    assert 0.2 <= await elapsed(0, bucket=bucket) < 0.4
+
+@pytest.mark.asyncio
+async def test_bucket_disabled():
+    bucket = TokenBucket(-1)
+    bucket.consume(100)
+    assert await elapsed(100, bucket=bucket) < 0.05
+
+def test_parse_translations_in_query_order():
+    data = {'translated': {'2': 'b', '1': 'a', '3': 3}}
+    assert GroqTranslator._parse_translations(data, 3) == ['a', 'b', '3']
+
+def test_parse_translations_missing_key():
+    assert GroqTranslator._parse_translations({'translated': {'1': 'a', '3': 'c'}}, 3) is None
+
+def test_parse_translations_bare_string():
+    assert GroqTranslator._parse_translations({'translated': 'a'}, 1) == ['a']
+    assert GroqTranslator._parse_translations({'translated': 'a'}, 2) is None
+
+@pytest.mark.parametrize('data', [
+    None,
+    ['a'],
+    'a',
+    {},
+    {'translation': {'1': 'a'}},
+    {'translated': ['a']},
+])
+def test_parse_translations_malformed(data):
+    assert GroqTranslator._parse_translations(data, 1) is None
+
+def make_translator(monkeypatch, replies, context_retention=False):
+    """GroqTranslator whose API round trip returns `replies[query]` = (translation, trusted)."""
+    monkeypatch.setattr(GroqTranslator, '_CONTEXT_RETENTION', context_retention)
+    translator = GroqTranslator(check_groq_key=False, compressed_context=False)
+    sent = []
+
+    async def translate_uncached(to_lang, queries):
+        sent.append(queries)
+        return [replies[q][0] for q in queries], [replies[q][1] for q in queries]
+
+    translator._translate_uncached = translate_uncached
+    return translator, sent
+
+@pytest.mark.asyncio
+async def test_cache_reuses_translations(monkeypatch):
+    translator, sent = make_translator(monkeypatch, {'a': ('A', True), 'b': ('B', True), 'c': ('C', True)})
+    assert await translator._translate('JPN', 'English', ['a', 'b', 'a']) == ['A', 'B', 'A']
+    assert await translator._translate('JPN', 'English', ['b', 'c']) == ['B', 'C']
+    assert await translator._translate('JPN', 'German', ['a']) == ['A']
+    assert sent == [['a', 'b'], ['c'], ['a']]
+
+@pytest.mark.asyncio
+async def test_cache_skips_untrusted_and_empty(monkeypatch):
+    translator, sent = make_translator(monkeypatch, {'x': ('<think>The user wants', False), 'y': ('', True)})
+    for _ in range(2):
+        await translator._translate('JPN', 'English', ['x', 'y'])
+    assert sent == [['x', 'y'], ['x', 'y']]
+
+@pytest.mark.asyncio
+async def test_cache_bypassed_with_context_retention(monkeypatch):
+    translator, sent = make_translator(monkeypatch, {'a': ('A', True)}, context_retention=True)
+    for _ in range(2):
+        assert await translator._translate('JPN', 'English', ['a']) == ['A']
+    assert sent == [['a'], ['a']]
+
+def test_accept_reply_trusts_only_json_objects(monkeypatch):
+    translator, _ = make_translator(monkeypatch, {})
+    exchange = ({'role': 'user', 'content': 'prompt'}, '{"translated": {"1": "a"}}')
+    assert translator._accept_reply(({'translated': {'1': 'a'}}, exchange), 1) == (['a'], True)
+    # Text salvaged by the fallback parser comes without an exchange
+    assert translator._accept_reply(({'translated': 'a'}, None), 1) == (['a'], False)
+    assert translator._accept_reply(({'translated': 'a'}, exchange), 1) == (['a'], False)
+    assert translator._accept_reply(({'translated': {'2': 'a'}}, exchange), 1) == (None, False)